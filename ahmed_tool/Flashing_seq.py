@@ -1,13 +1,21 @@
 import customtkinter as ctk
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from tkinter import filedialog
+import bisect
+import hashlib
+import queue
 import re
 import os
+import threading
+import time
 
 # ============================================
 # FILE PATH CONFIGURATION
 # ============================================
 DEFAULT_FILE_PATH = "test.txt"  # Relative path to your DID file
+DEFAULT_SEQUENCE_PATH = "flash_sequence.txt"  # Relative path to your flashing sequence file
+MANIFEST_DIR = "manifests"  # Sector hashes of the last successful flash, one file per channel
 
 # --- Theme Configuration ---
 ctk.set_appearance_mode("Dark")
@@ -21,6 +29,773 @@ SIDEBAR_BG = "#2B2B30"     # Slightly lighter sidebar
 BORDER_GRAY = "#444448"    # Border color for sections
 TEXT_LABEL_GRAY = "#AAAAAA" # Secondary text color
 
+# ============================================
+# LOG STORE CONFIGURATION
+# ============================================
+# Severity level for each terminal color tag used by log_entry
+LOG_LEVELS = {
+    "red": "ERROR",
+    "green": "SUCCESS",
+    "blue": "INFO",
+    "white": "INFO",
+    "gray": "DEBUG",
+}
+
+LOG_VIEW_ALL = "All"
+LOG_VIEW_WINDOW = "Last 5 min"
+LOG_VIEW_OPTIONS = [LOG_VIEW_ALL, "Errors", "Success", "Info", LOG_VIEW_WINDOW]
+LOG_WINDOW_SECONDS = 5 * 60  # Time window used by the "Last 5 min" view
+LOG_PRUNE_MS = 1000  # How often the "Last 5 min" view drops expired lines
+
+
+class LogRecord:
+    """A single structured Output Log entry"""
+    __slots__ = ("timestamp", "level", "channel", "message", "color")
+
+    def __init__(self, timestamp, level, channel, message, color):
+        self.timestamp = timestamp
+        self.level = level
+        self.channel = channel
+        self.message = message
+        self.color = color
+
+    def stamp(self):
+        """Return the [HH:MM:SS:mmmm] stamp shown in the terminal"""
+        return self.timestamp.strftime("[%H:%M:%S:") + f"{self.timestamp.microsecond // 100:04d}]"
+
+    def text(self):
+        """Return the message text shown after the stamp"""
+        return f"Flashing the {self.message}\n"
+
+
+class LogStore:
+    """In-memory log records indexed by level, channel and time"""
+
+    def __init__(self):
+        self.records = []
+        self.timestamps = []  # Parallel to records, kept sorted for bisect
+        self.by_level = {}    # level -> list of record indexes
+        self.by_channel = {}  # channel -> list of record indexes
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, message, color="white", channel=None, timestamp=None):
+        """Append a record and update the indexes"""
+        if timestamp is None:
+            timestamp = datetime.now()
+
+        record = LogRecord(timestamp, LOG_LEVELS.get(color, "INFO"), channel, message, color)
+        index = len(self.records)
+        self.records.append(record)
+        # Records from the flashing thread arrive slightly out of order and the wall
+        # clock can step back; the record keeps its real time, the index stays sorted
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+        self.timestamps.append(timestamp)
+        self.by_level.setdefault(record.level, []).append(index)
+        if channel:
+            self.by_channel.setdefault(channel, []).append(index)
+        return record
+
+    def clear(self):
+        """Drop all records and indexes"""
+        self.records.clear()
+        self.timestamps.clear()
+        self.by_level.clear()
+        self.by_channel.clear()
+
+    def channels(self):
+        """Return the channels that have at least one record"""
+        return sorted(self.by_channel)
+
+    def query(self, level=None, channel=None, since=None, until=None):
+        """Return records matching all given filters, in insertion order"""
+        # Time window narrows the index range without scanning
+        start = bisect.bisect_left(self.timestamps, since) if since else 0
+        stop = bisect.bisect_right(self.timestamps, until) if until else len(self.records)
+        if start >= stop:
+            return []
+
+        # Start from the smallest index list, then check the remaining filters
+        candidates = None
+        for key, index in ((level, self.by_level), (channel, self.by_channel)):
+            if key is None:
+                continue
+            positions = index.get(key, [])
+            if candidates is None or len(positions) < len(candidates):
+                candidates = positions
+        if candidates is None:
+            return self.records[start:stop]
+
+        lo = bisect.bisect_left(candidates, start)
+        hi = bisect.bisect_left(candidates, stop)
+        result = []
+        for i in candidates[lo:hi]:
+            record = self.records[i]
+            if level is not None and record.level != level:
+                continue
+            if channel is not None and record.channel != channel:
+                continue
+            result.append(record)
+        return result
+
+
+# ============================================
+# FLASHING SEQUENCE ENGINE
+# ============================================
+# Matches lines like: Step3 = ComputeDigest, Timeout3 = 2.0 or SectorSize = 0x1000
+SEQUENCE_LINE_PATTERN = re.compile(r'^([A-Za-z_]+?)(\d*)\s*=\s*(.+?)\s*$')
+SEQUENCE_SETTINGS = {"sequence", "address", "sectorsize", "timeout", "retries"}
+SEQUENCE_STEP_KEYS = {"step", "service", "action", "timeout", "retries", "group"}
+ADDRESS_LIMIT = 1 << 32  # Addresses and sizes are sent as 4-byte fields
+FLASH_WORKERS = 4  # Worker threads for local steps that overlap ECU I/O
+SECTOR_HASH_SIZE = 32  # sha256 digest length used for sector manifests
+ECU_SERIAL_DID = 0xF18C  # ECUSerialNumberDataIdentifier, keys the stored sector manifests
+
+
+class FlashSequenceError(Exception):
+    """Raised for invalid sequence files and failed flashing steps"""
+
+
+class FlashAction:
+    """A sequence action and the context keys it reads and writes"""
+    __slots__ = ("function", "on_ecu", "reads", "writes")
+
+    def __init__(self, function, on_ecu, reads=(), writes=()):
+        self.function = function
+        self.on_ecu = on_ecu  # False for local actions that never touch the bus
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+
+
+class FlashStep:
+    """One compiled step of a flashing sequence"""
+    __slots__ = ("number", "name", "service", "action", "on_ecu", "reads", "writes",
+                 "timeout", "retries", "group")
+
+    def __init__(self, number, name, service, action, on_ecu, reads, writes, timeout, retries, group):
+        self.number = number
+        self.name = name
+        self.service = service  # Raw UDS request bytes, or None for Action steps
+        self.action = action
+        self.on_ecu = on_ecu    # False for local steps that never touch the bus
+        self.reads = reads      # Context keys the step uses
+        self.writes = writes    # Context keys the step sets
+        self.timeout = timeout
+        self.retries = retries
+        self.group = group
+
+
+class FlashSequence:
+    """Compiled flashing sequence: settings plus ordered execution batches"""
+
+    def __init__(self, name, steps, address, sector_size):
+        self.name = name
+        self.steps = steps
+        self.address = address
+        self.sector_size = sector_size
+        self.batches = self.build_batches(steps)
+
+    @staticmethod
+    def build_batches(steps):
+        """Merge consecutive steps sharing a Group number into one batch"""
+        batches = []
+        for step in steps:
+            if step.group is not None and batches and batches[-1][0].group == step.group:
+                batches[-1].append(step)
+            else:
+                batches.append([step])
+        return batches
+
+
+class StepResult:
+    """Outcome and timing of one executed step"""
+    __slots__ = ("step", "duration", "requests", "retries", "error")
+
+    def __init__(self, step, duration, requests, retries, error=None):
+        self.step = step
+        self.duration = duration  # Seconds, including retries
+        self.requests = requests  # UDS requests sent, including re-sends (0 for local steps)
+        self.retries = retries    # Re-sent requests of an ECU step, or re-runs of a local step
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class SectorManifest:
+    """Per-sector hashes of the image last written to an ECU"""
+    __slots__ = ("address", "sector_size", "image_size", "hashes", "ecu_serial")
+
+    def __init__(self, address, sector_size, image_size, hashes, ecu_serial=None):
+        self.address = address
+        self.sector_size = sector_size
+        self.image_size = image_size
+        self.hashes = hashes
+        self.ecu_serial = ecu_serial  # Serial of the ECU the hashes describe
+
+    def matches(self, context):
+        """Check that the manifest describes this ECU and the same layout as the new image"""
+        return (self.ecu_serial == context.get("ecu_serial")
+                and self.address == context["address"]
+                and self.sector_size == context["sector_size"]
+                and self.image_size == len(context["image"])
+                and len(self.hashes) == sector_count(self.image_size, self.sector_size))
+
+
+def sector_count(image_size, sector_size):
+    """Number of sectors covering an image, counting a partial last sector"""
+    return -(-image_size // sector_size)
+
+
+def read_sector_manifest(path):
+    """Read a sector manifest file, or return None if missing or unreadable"""
+    if not os.path.exists(path):
+        return None
+
+    settings = {}
+    hashes = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                match = SEQUENCE_LINE_PATTERN.match(line.strip())
+                if not match:
+                    continue
+                key, number, value = match.groups()
+                if key.lower() == "sector" and number:
+                    hashes[int(number)] = bytes.fromhex(value)
+                else:
+                    settings[key.lower()] = value
+        manifest = SectorManifest(int(settings["address"], 16), int(settings["sectorsize"], 16),
+                                 int(settings["imagesize"], 16),
+                                 [hashes[i] for i in range(1, len(hashes) + 1)],
+                                 settings["ecuserial"])
+    except (KeyError, ValueError):
+        return None
+
+    # A truncated or hand-edited manifest must not drive a delta flash
+    if manifest.sector_size <= 0 or len(manifest.hashes) != sector_count(manifest.image_size, manifest.sector_size):
+        return None
+    if any(len(digest) != SECTOR_HASH_SIZE for digest in manifest.hashes):
+        return None
+    return manifest
+
+
+def write_sector_manifest(path, manifest):
+    """Write a sector manifest file in the same key = value style as the DID file"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(f"EcuSerial = {manifest.ecu_serial}\n")
+        file.write(f"Address = 0x{manifest.address:08X}\n")
+        file.write(f"SectorSize = 0x{manifest.sector_size:X}\n")
+        file.write(f"ImageSize = 0x{manifest.image_size:X}\n\n")
+        for number, digest in enumerate(manifest.hashes, 1):
+            file.write(f"Sector{number} = {digest.hex()}\n")
+
+
+def image_regions(context):
+    """Return the (first, end) sector ranges to write, defaulting to the whole image"""
+    if "regions" in context:
+        return context["regions"]
+    return [(0, sector_count(len(context["image"]), context["sector_size"]))]
+
+
+def region_bounds(context, first, end):
+    """Return the image offsets [start, stop) covering sectors [first, end)"""
+    size = context["sector_size"]
+    return first * size, min(end * size, len(context["image"]))
+
+
+def region_span(context, first, end):
+    """Return the address and size bytes covering sectors [first, end)"""
+    start, stop = region_bounds(context, first, end)
+    return (context["address"] + start).to_bytes(4, "big"), (stop - start).to_bytes(4, "big")
+
+
+def transfer_length(response):
+    """Return the TransferData payload size allowed by a RequestDownload (0x74) response"""
+    length_size = response[1] >> 4 if len(response) > 1 else 0
+    if not length_size or len(response) < 2 + length_size:
+        raise FlashSequenceError("RequestDownload response has no maxNumberOfBlockLength")
+    # maxNumberOfBlockLength counts the service ID and block sequence counter too
+    max_length = int.from_bytes(response[2:2 + length_size], "big")
+    if max_length <= 2:
+        raise FlashSequenceError(f"ECU maxNumberOfBlockLength {max_length} leaves no room for data")
+    return max_length - 2
+
+
+def uds_request(ecu, payload, timeout):
+    """Send a UDS request and return the positive response"""
+    deadline = time.perf_counter() + timeout
+    response = ecu.request(payload, timeout)
+    # responsePending: the ECU is still busy (erase, checks), keep waiting up to the timeout
+    while response and response[0] == 0x7F and response[2:3] == b"\x78":
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise TimeoutError(f"Service 0x{payload[0]:02X} still pending after {timeout}s")
+        response = ecu.receive(remaining)
+    if not response:
+        raise FlashSequenceError(f"No response to service 0x{payload[0]:02X}")
+    if response[0] == 0x7F:
+        nrc = response[2] if len(response) > 2 else 0
+        raise FlashSequenceError(f"Negative response to service 0x{payload[0]:02X} (NRC 0x{nrc:02X})")
+    if response[0] != payload[0] + 0x40:
+        raise FlashSequenceError(f"Unexpected response 0x{response[0]:02X} to service 0x{payload[0]:02X}")
+    return response
+
+
+# --- Local actions: action(context) ---
+
+def action_compute_digest(context):
+    """Compute the image digest used by CheckDigest"""
+    context["digest"] = hashlib.sha256(context["image"]).digest()
+
+
+def hash_sectors(data, sector_size):
+    """Hash data in sector_size pieces, the last one possibly shorter"""
+    data = memoryview(data)
+    return [hashlib.sha256(data[i:i + sector_size]).digest() for i in range(0, len(data), sector_size)]
+
+
+def action_hash_sectors(context):
+    """Hash every sector of the new image for delta planning and the manifest"""
+    context["sector_hashes"] = hash_sectors(context["image"], context["sector_size"])
+
+
+def action_plan_delta(context):
+    """Compare sector hashes with the manifest and keep only changed regions"""
+    hashes = context["sector_hashes"]
+    manifest = context.get("manifest")
+    full = [(0, len(hashes))] if hashes else []
+    if manifest is None or not manifest.matches(context):
+        # No usable manifest: fall back to a full flash
+        context["regions"] = full
+        context["delta"] = False
+        return
+
+    regions = []
+    for index, digest in enumerate(hashes):
+        if digest == manifest.hashes[index]:
+            continue
+        if regions and regions[-1][1] == index:
+            regions[-1] = (regions[-1][0], index + 1)
+        else:
+            regions.append((index, index + 1))
+
+    # Every sector changed is a full flash, whatever the manifest said
+    context["delta"] = regions != full
+    context["regions"] = regions
+
+
+# --- ECU actions: action(context, send) ---
+
+def action_security_access(context, send):
+    """Request a seed and answer with the key from the ECU's seed/key algorithm"""
+    key_from_seed = context["key_from_seed"]
+    if key_from_seed is None:
+        raise FlashSequenceError("No seed/key algorithm available for this ECU")
+    seed = send(bytes([0x27, 0x01]))[2:]
+    send(bytes([0x27, 0x02]) + key_from_seed(seed))
+
+
+def action_read_ecu_identity(context, send):
+    """Read the ECU serial number and load the stored manifest of that ECU"""
+    context["ecu_serial"] = None
+    context["manifest"] = None
+    try:
+        response = send(bytes([0x22]) + ECU_SERIAL_DID.to_bytes(2, "big"))
+    except (FlashSequenceError, TimeoutError):
+        return  # Unknown ECU: no stored manifest can be trusted
+
+    serial = response[3:].hex().upper()
+    if not serial:
+        return
+    context["ecu_serial"] = serial
+    load_manifest = context["load_manifest"]
+    if load_manifest is not None:
+        context["manifest"] = load_manifest(serial)
+
+
+def action_read_sector_hashes(context, send):
+    """Read the sector hashes currently on the ECU, replacing the stored manifest"""
+    image_size = len(context["image"])
+    sector_size = context["sector_size"]
+    try:
+        response = send(bytes([0x31, 0x01, 0x02, 0x03]) + context["address"].to_bytes(4, "big")
+                        + sector_size.to_bytes(4, "big") + image_size.to_bytes(4, "big"))
+    except (FlashSequenceError, TimeoutError):
+        return  # ECU cannot report hashes; keep the stored manifest
+
+    data = response[4:]
+    if len(data) != sector_count(image_size, sector_size) * SECTOR_HASH_SIZE:
+        return
+    hashes = [data[i:i + SECTOR_HASH_SIZE] for i in range(0, len(data), SECTOR_HASH_SIZE)]
+
+    # An erased ECU reads back as 0xFF everywhere: nothing to compare against
+    if hashes == hash_sectors(b"\xFF" * image_size, sector_size):
+        context["manifest"] = None
+        return
+    context["manifest"] = SectorManifest(context["address"], sector_size, image_size, hashes,
+                                        context.get("ecu_serial"))
+
+
+def action_erase_memory(context, send):
+    """Erase the memory covered by each region to write"""
+    for first, end in image_regions(context):
+        address, size = region_span(context, first, end)
+        send(bytes([0x31, 0x01, 0xFF, 0x00, 0x44]) + address + size)
+
+
+def action_download_regions(context, send):
+    """RequestDownload, TransferData and TransferExit for each region to write"""
+    image = memoryview(context["image"])
+    for first, end in image_regions(context):
+        start, stop = region_bounds(context, first, end)
+        address, size = region_span(context, first, end)
+        # The ECU sets the TransferData size, independent of the sector size
+        length = transfer_length(send(bytes([0x34, 0x00, 0x44]) + address + size))
+        for counter, offset in enumerate(range(start, stop, length), 1):
+            send(bytes([0x36, counter & 0xFF]) + image[offset:min(offset + length, stop)])
+        send(bytes([0x37]))
+
+
+def action_check_digest(context, send):
+    """Ask the ECU to verify the written image against its digest"""
+    address = context["address"].to_bytes(4, "big")
+    size = len(context["image"]).to_bytes(4, "big")
+    send(bytes([0x31, 0x01, 0x02, 0x02]) + address + size + context["digest"])
+
+
+# "image", "address", "sector_size", "key_from_seed" and "load_manifest" are set
+# by the scheduler and never written by an action
+FLASH_ACTIONS = {
+    "compute_digest": FlashAction(action_compute_digest, False,
+                                  reads={"image"}, writes={"digest"}),
+    "hash_sectors": FlashAction(action_hash_sectors, False,
+                               reads={"image", "sector_size"}, writes={"sector_hashes"}),
+    "plan_delta": FlashAction(action_plan_delta, False,
+                              reads={"image", "address", "sector_size", "sector_hashes", "manifest",
+                                     "ecu_serial"},
+                              writes={"regions", "delta"}),
+    "security_access": FlashAction(action_security_access, True, reads={"key_from_seed"}),
+    "erase_memory": FlashAction(action_erase_memory, True,
+                                reads={"image", "address", "sector_size", "regions"}),
+    "read_ecu_identity": FlashAction(action_read_ecu_identity, True,
+                                     reads={"load_manifest"}, writes={"ecu_serial", "manifest"}),
+    "read_sector_hashes": FlashAction(action_read_sector_hashes, True,
+                                     reads={"image", "address", "sector_size", "ecu_serial"},
+                                     writes={"manifest"}),
+    "download_regions": FlashAction(action_download_regions, True,
+                                    reads={"image", "address", "sector_size", "regions"}),
+    "check_digest": FlashAction(action_check_digest, True, reads={"image", "address", "digest"}),
+}
+
+
+def read_flash_sequence(path):
+    """Read and compile a flashing sequence file"""
+    if not os.path.exists(path):
+        raise FlashSequenceError(f"File not found - {path}")
+    with open(path, 'r', encoding='utf-8') as file:
+        return compile_flash_sequence(file.read())
+
+
+def compile_flash_sequence(content):
+    """Compile sequence file content into a FlashSequence"""
+    settings = {}
+    fields = {}  # Step number -> {key: value}
+
+    for line_number, line in enumerate(content.split('\n'), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        match = SEQUENCE_LINE_PATTERN.match(line)
+        if not match:
+            raise FlashSequenceError(f"Line {line_number}: cannot parse '{line}'")
+        key, number, value = match.groups()
+        key = key.lower()
+        if not number:
+            if key not in SEQUENCE_SETTINGS:
+                raise FlashSequenceError(f"Line {line_number}: unknown setting '{match.group(1)}'")
+            settings[key] = value
+        elif key in SEQUENCE_STEP_KEYS:
+            fields.setdefault(int(number), {})[key] = value
+        else:
+            raise FlashSequenceError(f"Line {line_number}: unknown step key '{match.group(1)}'")
+
+    try:
+        timeout = float(settings.get("timeout", "1.0"))
+        retries = int(settings.get("retries", "0"))
+        address = int(settings.get("address", "0x0"), 16)
+        sector_size = int(settings.get("sectorsize", "0x1000"), 16)
+    except ValueError as e:
+        raise FlashSequenceError(f"Invalid sequence setting: {e}")
+    if not timeout > 0:
+        raise FlashSequenceError(f"Timeout must be positive, got {timeout}")
+    if retries < 0:
+        raise FlashSequenceError(f"Retries must not be negative, got {retries}")
+    if not 0 <= address < ADDRESS_LIMIT:
+        raise FlashSequenceError(f"Address must fit in 4 bytes, got 0x{address:X}")
+    if sector_size <= 0:
+        raise FlashSequenceError(f"SectorSize must be positive, got {sector_size}")
+
+    steps = []
+    for number in sorted(fields):
+        entry = fields[number]
+        name = entry.get("step", f"Step{number}")
+        if ("service" in entry) == ("action" in entry):
+            raise FlashSequenceError(f"Step{number} ({name}) needs exactly one of Service or Action")
+
+        try:
+            service = bytes(int(b, 16) for b in entry["service"].split()) if "service" in entry else None
+            step_timeout = float(entry.get("timeout", timeout))
+            step_retries = int(entry.get("retries", retries))
+            group = int(entry["group"]) if "group" in entry else None
+        except ValueError as e:
+            raise FlashSequenceError(f"Step{number} ({name}): {e}")
+        if service is not None and not service:
+            raise FlashSequenceError(f"Step{number} ({name}): Service has no request bytes")
+        if not step_timeout > 0:
+            raise FlashSequenceError(f"Step{number} ({name}): Timeout must be positive, got {step_timeout}")
+        if step_retries < 0:
+            raise FlashSequenceError(f"Step{number} ({name}): Retries must not be negative, got {step_retries}")
+
+        if "action" in entry:
+            action = FLASH_ACTIONS.get(entry["action"].lower())
+            if action is None:
+                raise FlashSequenceError(f"Step{number} ({name}): unknown action '{entry['action']}'")
+            steps.append(FlashStep(number, name, None, action.function, action.on_ecu, action.reads,
+                                   action.writes, step_timeout, step_retries, group))
+        else:
+            steps.append(FlashStep(number, name, service, None, True, frozenset(), frozenset(),
+                                   step_timeout, step_retries, group))
+
+    if not steps:
+        raise FlashSequenceError("No steps found in sequence file")
+    sequence = FlashSequence(settings.get("sequence", "Unnamed"), steps, address, sector_size)
+    for batch in sequence.batches:
+        check_batch_is_parallel_safe(batch)
+    return sequence
+
+
+def check_batch_is_parallel_safe(batch):
+    """Reject a batch where a step running in parallel shares a context key with another"""
+    for i, first in enumerate(batch):
+        for second in batch[i + 1:]:
+            # ECU steps run one after another in file order; only local steps overlap
+            if first.on_ecu and second.on_ecu:
+                continue
+            shared = ((first.reads & second.writes) | (first.writes & second.reads)
+                      | (first.writes & second.writes))
+            if shared:
+                raise FlashSequenceError(
+                    f"Group{first.group}: Step{first.number} ({first.name}) and Step{second.number} "
+                    f"({second.name}) both use '{sorted(shared)[0]}' and cannot run in parallel")
+
+
+class SimulatedECU:
+    """Stand-in ECU answering UDS requests until a CANoe channel is wired in"""
+    simulated = True  # Flashing runs against this ECU never touch hardware
+
+    def __init__(self, latency=0.005, bytes_per_second=100000, erase_bytes_per_second=1000000,
+                 max_block_length=0x402):
+        self.latency = latency  # Fixed round-trip time per request
+        self.max_block_length = max_block_length  # TransferData request length, SID and counter included
+        self.bytes_per_second = bytes_per_second
+        self.erase_bytes_per_second = erase_bytes_per_second
+        self.pending = None  # (final response, seconds still busy) after a responsePending
+        self.seed = os.urandom(4)
+        self.serial = b"SIM" + os.urandom(6).hex().upper().encode()
+        self.memory = bytearray()  # Flash contents, kept across flashes of this instance
+        self.write_address = 0
+
+    def request(self, payload, timeout):
+        delay = self.latency + len(payload) / self.bytes_per_second
+        if delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"No response to service 0x{payload[0]:02X} within {timeout}s")
+        time.sleep(delay)
+
+        sid = payload[0]
+        if sid == 0x22:
+            if payload[1:3] != ECU_SERIAL_DID.to_bytes(2, "big"):
+                return bytes([0x7F, 0x22, 0x31])  # requestOutOfRange
+            return bytes([0x62]) + payload[1:3] + self.serial
+        if sid == 0x27 and payload[1:2] == b"\x01":
+            return bytes([0x67, 0x01]) + self.seed
+        if sid == 0x27 and payload[2:] != self.key_from_seed(self.seed):
+            return bytes([0x7F, 0x27, 0x35])  # invalidKey
+
+        if sid == 0x31 and payload[2:4] == b"\xFF\x00":
+            address = int.from_bytes(payload[5:9], "big")
+            size = int.from_bytes(payload[9:13], "big")
+            self.write(address, b"\xFF" * size)
+            # Erasing takes a while: answer responsePending, the result follows via receive()
+            self.pending = (bytes([0x71]) + payload[1:2], size / self.erase_bytes_per_second)
+            return bytes([0x7F, 0x31, 0x78])
+        elif sid == 0x31 and payload[2:4] == b"\x02\x02":
+            address = int.from_bytes(payload[4:8], "big")
+            size = int.from_bytes(payload[8:12], "big")
+            if hashlib.sha256(self.memory[address:address + size]).digest() != payload[12:]:
+                return bytes([0x7F, 0x31, 0x72])  # generalProgrammingFailure
+        elif sid == 0x31 and payload[2:4] == b"\x02\x03":
+            address = int.from_bytes(payload[4:8], "big")
+            sector_size = int.from_bytes(payload[8:12], "big")
+            size = int.from_bytes(payload[12:16], "big")
+            # Flash that was never written reads back as erased
+            data = bytes(self.memory[address:address + size])
+            data += b"\xFF" * (size - len(data))
+            return bytes([0x71]) + payload[1:4] + b"".join(hash_sectors(data, sector_size))
+        elif sid == 0x34:
+            self.write_address = int.from_bytes(payload[3:7], "big")
+            return bytes([0x74, 0x20]) + self.max_block_length.to_bytes(2, "big")
+        elif sid == 0x36 and len(payload) > self.max_block_length:
+            return bytes([0x7F, 0x36, 0x13])  # incorrectMessageLengthOrInvalidFormat
+        elif sid == 0x36:
+            self.write(self.write_address, payload[2:])
+            self.write_address += len(payload) - 2
+        return bytes([sid + 0x40]) + payload[1:2]
+
+    def receive(self, timeout):
+        """Wait for the final response to a request answered with responsePending"""
+        if self.pending is None:
+            time.sleep(timeout)
+            raise TimeoutError(f"No response within {timeout}s")
+        response, busy = self.pending
+        if busy > timeout:
+            time.sleep(timeout)
+            self.pending = (response, busy - timeout)
+            raise TimeoutError(f"No response within {timeout}s")
+        time.sleep(busy)
+        self.pending = None
+        return response
+
+    def key_from_seed(self, seed):
+        """Seed/key algorithm of the simulator (not a real ECU family)"""
+        return bytes(b ^ 0xFF for b in seed)
+
+    def write(self, address, data):
+        """Write data into simulated flash, growing it as needed"""
+        end = address + len(data)
+        if end > len(self.memory):
+            self.memory.extend(b"\xFF" * (end - len(self.memory)))
+        self.memory[address:end] = data
+
+
+class FlashScheduler:
+    """Run a compiled sequence, overlapping local steps with ECU I/O"""
+
+    def __init__(self, sequence, ecu, log=None):
+        self.sequence = sequence
+        self.ecu = ecu
+        self.log = log or (lambda message, color: None)
+        self.context = {}  # Shared step state of the last run
+
+    def run(self, image, load_manifest=None):
+        """Run every batch in order and return the StepResults executed"""
+        context = {
+            "image": image,
+            "address": self.sequence.address,
+            "sector_size": self.sequence.sector_size,
+            "key_from_seed": getattr(self.ecu, "key_from_seed", None),
+            # ECU serial -> stored SectorManifest or None, used once ReadECUIdentity knows the ECU
+            "load_manifest": load_manifest,
+            "ecu_serial": None,
+            "manifest": None,
+        }
+        self.context = context
+        results = []
+        if not image:
+            raise FlashSequenceError("Image is empty")
+        if self.sequence.address + len(image) > ADDRESS_LIMIT:
+            raise FlashSequenceError(f"Image of {len(image)} bytes does not fit above address "
+                                     f"0x{self.sequence.address:08X}")
+
+        with ThreadPoolExecutor(max_workers=FLASH_WORKERS) as pool:
+            for batch in self.sequence.batches:
+                # Local steps go to worker threads; ECU steps stay in file order on this thread
+                futures = [pool.submit(self.run_step, step, context) for step in batch if not step.on_ecu]
+                batch_results = []
+                for step in batch:
+                    if step.on_ecu:
+                        batch_results.append(self.run_step(step, context))
+                        if not batch_results[-1].ok:
+                            break
+                batch_results += [future.result() for future in futures]
+                batch_results.sort(key=lambda result: result.step.number)
+
+                results.extend(batch_results)
+                if not all(result.ok for result in batch_results):
+                    break
+
+        return results
+
+    def written_manifest(self):
+        """Manifest of the image written by the last run, to store after a successful flash"""
+        context = self.context
+        if "sector_hashes" not in context:
+            action_hash_sectors(context)
+        return SectorManifest(context["address"], context["sector_size"], len(context["image"]),
+                             context["sector_hashes"], context["ecu_serial"])
+
+    def run_step(self, step, context):
+        """Run one step with its timeout and retries"""
+        start = time.perf_counter()
+        if step.on_ecu:
+            requests, retries, error = self.run_ecu_step(step, context)
+        else:
+            requests = 0
+            retries, error = self.run_local_step(step, context)
+        return StepResult(step, time.perf_counter() - start, requests, retries, error)
+
+    def run_ecu_step(self, step, context):
+        """Run an ECU step once, re-sending only the request that timed out"""
+        counts = {"requests": 0, "retries": 0}
+
+        def send(payload):
+            # Retrying the single request keeps a download open and the TransferData
+            # sequence counter unchanged, which restarting the whole step would not
+            for attempt in range(step.retries + 1):
+                counts["requests"] += 1
+                try:
+                    return uds_request(self.ecu, payload, step.timeout)
+                except TimeoutError as e:
+                    if attempt == step.retries:
+                        raise
+                    counts["retries"] += 1
+                    self.log(f"Step{step.number} {step.name}: {e}, retrying", "red")
+
+        error = None
+        try:
+            if step.service is not None:
+                send(step.service)
+            else:
+                step.action(context, send)
+        except Exception as e:
+            error = str(e)
+            self.log(f"Step{step.number} {step.name} failed: {error}", "red")
+        return counts["requests"], counts["retries"], error
+
+    def run_local_step(self, step, context):
+        """Run a local step, re-running it until it succeeds or retries run out"""
+        error = None
+        for attempt in range(1, step.retries + 2):
+            try:
+                # Local steps cannot be interrupted, so their timeout is checked afterwards
+                attempt_start = time.perf_counter()
+                step.action(context)
+                if time.perf_counter() - attempt_start > step.timeout:
+                    raise TimeoutError(f"Took longer than {step.timeout}s")
+                return attempt - 1, None
+            except Exception as e:
+                error = str(e)
+                self.log(f"Step{step.number} {step.name} attempt {attempt} failed: {error}", "red")
+        return step.retries, error
+
+
 class ValeoProfessionalGUI(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -41,6 +816,20 @@ class ValeoProfessionalGUI(ctk.CTk):
         self.selected_did_length = None
         self.is_selecting_from_list = False  # Flag to prevent dropdown reopening
 
+        # --- Log Store Variables ---
+        self.log_store = LogStore()  # Structured records behind the Output Log
+        self.log_view = LOG_VIEW_ALL  # Active level/time view of the terminal
+        self.log_channel_view = LOG_VIEW_ALL  # Active ECU/channel view of the terminal
+        self.displayed_records = []  # Records currently shown in the terminal, oldest first
+        self.log_prune_job = None  # Pending "Last 5 min" prune callback
+
+        # --- Flashing Variables ---
+        self.sequence_path = DEFAULT_SEQUENCE_PATH
+        self.flash_sequence = None  # Compiled once at startup
+        self.flash_thread = None
+        self.flash_queue = queue.Queue()  # Log messages from the flashing thread
+        self.simulated_ecus = {}  # Channel -> SimulatedECU, keeps flash contents between runs
+
         # --- 1. SIDEBAR (Command Rail) ---
         self.sidebar = ctk.CTkFrame(self, width=280, corner_radius=0, fg_color=SIDEBAR_BG, border_width=0)
         self.sidebar.grid(row=0, column=0, sticky="nsew")
@@ -71,7 +860,8 @@ class ValeoProfessionalGUI(ctk.CTk):
         self.btn_flash = ctk.CTkButton(self.sidebar, text="⚡ Start Flashing", 
                                        height=55, font=("Arial", 16, "bold"),
                                        fg_color=FLASH_GREEN, hover_color="#458A26",
-                                       corner_radius=10, anchor="w")
+                                       corner_radius=10, anchor="w",
+                                       command=self.start_flashing)
         self.btn_flash.grid(row=2, column=0, padx=25, pady=12, sticky="ew")
 
         # BOTTOM BUTTONS
@@ -151,6 +941,17 @@ class ValeoProfessionalGUI(ctk.CTk):
         self.button_container = ctk.CTkFrame(self.log_box, fg_color="transparent")
         self.button_container.place(relx=1.0, rely=1.0, x=-20, y=-20, anchor="se")
 
+        # Log view filters (level/time window and ECU channel)
+        self.log_view_cb = ctk.CTkComboBox(self.button_container, values=LOG_VIEW_OPTIONS, width=120, height=32,
+                                           fg_color="#2B2B30", state="readonly", command=self.on_log_view_change)
+        self.log_view_cb.set(LOG_VIEW_ALL)
+        self.log_view_cb.pack(side="left", padx=(0, 10))
+
+        self.log_channel_cb = ctk.CTkComboBox(self.button_container, values=[LOG_VIEW_ALL], width=120, height=32,
+                                              fg_color="#2B2B30", state="readonly", command=self.on_log_channel_change)
+        self.log_channel_cb.set(LOG_VIEW_ALL)
+        self.log_channel_cb.pack(side="left", padx=(0, 10))
+
         self.btn_save = ctk.CTkButton(self.button_container, text="💾 Save Log", width=110, height=32, fg_color="#333338",
                                       command=self.save_log)
         self.btn_save.pack(side="left", padx=(0, 10))
@@ -161,6 +962,9 @@ class ValeoProfessionalGUI(ctk.CTk):
 
         # Load DID file on startup
         self.load_did_file()
+
+        # Compile flashing sequence on startup
+        self.load_flash_sequence()
         
         # Bind window move/resize to close dropdown
         self.bind('<Configure>', self.on_window_configure)
@@ -177,23 +981,105 @@ class ValeoProfessionalGUI(ctk.CTk):
         title_label.place(x=20, y=0)
         return border_frame
 
-    def log_entry(self, message, color="white"):
-        # Format: [HH:MM:SS:mmmm] with 4-digit milliseconds
-        now = datetime.now()
-        stamp = now.strftime("[%H:%M:%S:") + f"{now.microsecond // 100:04d}]"
-        
+    def log_entry(self, message, color="white", channel=None, timestamp=None):
+        # Record goes to the store first; the terminal only shows the active view
+        if channel is None:
+            channel = self.chan_cb.get()
+        record = self.log_store.add(message, color, channel, timestamp)
+
+        if channel and channel not in self.log_channel_cb.cget("values"):
+            self.log_channel_cb.configure(values=[LOG_VIEW_ALL] + self.log_store.channels())
+
+        if not self.record_in_view(record):
+            return
+
         # Temporarily enable editing to insert text
         self.terminal.configure(state="normal")
-        self.terminal.insert("end", f"{stamp} ", "gray")
-        self.terminal.insert("end", f"Flashing the {message}\n", color)
+        self.insert_log_record(record)
+        self.displayed_records.append(record)
         self.terminal.see("end")
         # Make read-only again
         self.terminal.configure(state="disabled")
-    
+
     # ============================================
     # LOG FUNCTIONALITY
     # ============================================
-    
+
+    def insert_log_record(self, record):
+        """Insert one record into the terminal (caller handles textbox state)"""
+        # Format: [HH:MM:SS:mmmm] with 4-digit milliseconds
+        self.terminal.insert("end", f"{record.stamp()} ", "gray")
+        self.terminal.insert("end", record.text(), record.color)
+
+    def log_view_filters(self):
+        """Translate the selected views into LogStore.query filters"""
+        filters = {}
+        if self.log_view == LOG_VIEW_WINDOW:
+            filters["since"] = datetime.now() - timedelta(seconds=LOG_WINDOW_SECONDS)
+        elif self.log_view != LOG_VIEW_ALL:
+            filters["level"] = {"Errors": "ERROR", "Success": "SUCCESS", "Info": "INFO"}[self.log_view]
+        if self.log_channel_view != LOG_VIEW_ALL:
+            filters["channel"] = self.log_channel_view
+        return filters
+
+    def record_in_view(self, record):
+        """Check whether a freshly logged record belongs to the active view"""
+        filters = self.log_view_filters()
+        if "level" in filters and record.level != filters["level"]:
+            return False
+        if "channel" in filters and record.channel != filters["channel"]:
+            return False
+        # A new record is always inside the "Last 5 min" window
+        return True
+
+    def refresh_log_view(self):
+        """Re-render the terminal from the log store using the active view"""
+        records = self.log_store.query(**self.log_view_filters())
+        self.displayed_records = list(records)
+
+        self.terminal.configure(state="normal")
+        self.terminal.delete("1.0", "end")
+        for record in records:
+            self.insert_log_record(record)
+        self.terminal.see("end")
+        self.terminal.configure(state="disabled")
+
+    def prune_log_window(self):
+        """Drop records that aged out of the "Last 5 min" view from the terminal"""
+        self.log_prune_job = None
+        if self.log_view != LOG_VIEW_WINDOW:
+            return
+
+        cutoff = datetime.now() - timedelta(seconds=LOG_WINDOW_SECONDS)
+        expired = 0
+        while expired < len(self.displayed_records) and self.displayed_records[expired].timestamp < cutoff:
+            expired += 1
+
+        if expired:
+            lines = sum(record.text().count("\n") for record in self.displayed_records[:expired])
+            del self.displayed_records[:expired]
+            self.terminal.configure(state="normal")
+            self.terminal.delete("1.0", f"{lines + 1}.0")
+            self.terminal.configure(state="disabled")
+
+        self.log_prune_job = self.after(LOG_PRUNE_MS, self.prune_log_window)
+
+    def on_log_view_change(self, choice):
+        """Handle level/time view selection"""
+        self.log_view = choice
+        self.refresh_log_view()
+
+        if self.log_prune_job:
+            self.after_cancel(self.log_prune_job)
+            self.log_prune_job = None
+        if choice == LOG_VIEW_WINDOW:
+            self.log_prune_job = self.after(LOG_PRUNE_MS, self.prune_log_window)
+
+    def on_log_channel_change(self, choice):
+        """Handle ECU/channel view selection"""
+        self.log_channel_view = choice
+        self.refresh_log_view()
+
     def save_log(self):
         """Save the output log to a file"""
         from tkinter import filedialog
@@ -207,8 +1093,8 @@ class ValeoProfessionalGUI(ctk.CTk):
         
         if file_path:
             try:
-                # Get all text from terminal
-                log_content = self.terminal.get("1.0", "end-1c")
+                # Save every record, not just the filtered view shown in the terminal
+                log_content = "".join(f"{record.stamp()} {record.text()}" for record in self.log_store.records)
                 
                 # Write to file
                 with open(file_path, 'w', encoding='utf-8') as f:
@@ -220,6 +1106,12 @@ class ValeoProfessionalGUI(ctk.CTk):
     
     def clear_output(self):
         """Clear the output log"""
+        self.log_store.clear()
+        self.displayed_records = []
+        self.log_channel_view = LOG_VIEW_ALL
+        self.log_channel_cb.configure(values=[LOG_VIEW_ALL])
+        self.log_channel_cb.set(LOG_VIEW_ALL)
+
         # Temporarily enable to clear, then disable again
         self.terminal.configure(state="normal")
         self.terminal.delete("1.0", "end")
@@ -706,6 +1598,146 @@ class ValeoProfessionalGUI(ctk.CTk):
         except Exception as e:
             self.log_entry(f"Error updating file: {str(e)}", "red")
 
+    # ============================================
+    # FLASHING FUNCTIONALITY
+    # ============================================
+
+    def load_flash_sequence(self):
+        """Compile the flashing sequence file"""
+        try:
+            self.flash_sequence = read_flash_sequence(self.sequence_path)
+            self.log_entry(f"Loaded sequence '{self.flash_sequence.name}' with "
+                           f"{len(self.flash_sequence.steps)} steps", "green")
+        except FlashSequenceError as e:
+            self.log_entry(f"Error loading sequence: {str(e)}", "red")
+
+    def start_flashing(self):
+        """Pick an image and run the flashing sequence in the background"""
+        if self.flash_thread and self.flash_thread.is_alive():
+            self.log_entry("Flashing already in progress", "red")
+            return
+        if not self.flash_sequence:
+            self.log_entry("Error: No flashing sequence loaded", "red")
+            return
+
+        image_path = filedialog.askopenfilename(
+            filetypes=[("Binary files", "*.bin"), ("All files", "*.*")],
+            title="Select Flash Image"
+        )
+        if not image_path:
+            return
+
+        try:
+            with open(image_path, 'rb') as file:
+                image = file.read()
+        except Exception as e:
+            self.log_entry(f"Error reading image: {str(e)}", "red")
+            return
+        if not image:
+            self.log_entry(f"Error: Image is empty - {image_path}", "red")
+            return
+
+        channel = self.chan_cb.get()
+        ecu = self.simulated_ecus.setdefault(channel, SimulatedECU())
+
+        self.btn_flash.configure(state="disabled")
+        self.log_entry(f"{os.path.basename(image_path)} ({len(image)} bytes) "
+                       f"with sequence '{self.flash_sequence.name}' on {self.flash_target(ecu, channel)}", "blue")
+        self.flash_thread = threading.Thread(target=self.run_flash_sequence, args=(image, channel, ecu),
+                                             daemon=True)
+        self.flash_thread.start()
+        self.after(50, self.poll_flash_log)
+
+    def flash_target(self, ecu, channel):
+        """Describe where a flash goes, making simulated runs obvious in the log"""
+        if getattr(ecu, "simulated", False):
+            return f"SIMULATED ECU for {channel} (no hardware connected)"
+        return channel
+
+    def manifest_path(self, ecu_serial, simulated=False):
+        """Return the sector manifest file for an ECU serial number"""
+        # Simulated runs keep their own manifests so they never feed a real flash
+        suffix = "_simulated" if simulated else ""
+        return os.path.join(MANIFEST_DIR, re.sub(r'\W+', '_', ecu_serial) + suffix + ".txt")
+
+    def remove_sector_manifest(self, ecu_serial, simulated, log):
+        """Forget the stored manifest of an ECU whose contents are now unknown"""
+        if not ecu_serial:
+            return
+        try:
+            manifest_path = self.manifest_path(ecu_serial, simulated)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+        except Exception as e:
+            log(f"Error removing sector manifest: {str(e)}", "red")
+
+    def run_flash_sequence(self, image, channel, ecu):
+        """Flashing thread: run the scheduler and queue log messages for the GUI"""
+        # Stamp messages when they happen, not when the GUI drains the queue
+        log = lambda message, color: self.flash_queue.put((message, color, channel, datetime.now()))
+        scheduler = FlashScheduler(self.flash_sequence, ecu, log)
+        simulated = getattr(ecu, "simulated", False)
+        load_manifest = lambda ecu_serial: read_sector_manifest(self.manifest_path(ecu_serial, simulated))
+        target = self.flash_target(ecu, channel)
+
+        start = time.perf_counter()
+        try:
+            results = scheduler.run(image, load_manifest)
+        except Exception as e:
+            log(f"Flashing aborted: {str(e)}", "red")
+            # Same as a failed flash: the ECU may have been partly written
+            self.remove_sector_manifest(scheduler.context.get("ecu_serial"), simulated, log)
+            return
+        total = time.perf_counter() - start
+
+        context = scheduler.context
+        if "regions" in context:
+            changed = sum(end - first for first, end in context["regions"])
+            if context["delta"]:
+                log(f"delta: {changed} of {len(context['sector_hashes'])} sectors changed "
+                    f"in {len(context['regions'])} region(s)", "blue")
+            else:
+                log(f"full image: {changed} sectors (no usable sector manifest or every sector changed)", "blue")
+
+        for result in results:
+            status = "" if result.ok else f" FAILED: {result.error}"
+            counts = f"{result.requests} request(s), " if result.step.on_ecu else ""
+            log(f"Step{result.step.number} {result.step.name}: {result.duration * 1000:.1f} ms "
+                f"({counts}{result.retries} retried){status}", "white" if result.ok else "red")
+
+        step_total = sum(result.duration for result in results)
+        if len(results) == len(self.flash_sequence.steps) and all(result.ok for result in results):
+            log(f"sequence completed on {target} in {total * 1000:.1f} ms "
+                f"(steps {step_total * 1000:.1f} ms)", "green")
+            if not context["ecu_serial"]:
+                log("ECU serial number unknown, sector manifest not saved", "blue")
+                return
+            try:
+                write_sector_manifest(self.manifest_path(context["ecu_serial"], simulated),
+                                     scheduler.written_manifest())
+            except Exception as e:
+                log(f"Error saving sector manifest: {str(e)}", "red")
+        else:
+            log(f"sequence failed on {target} after {total * 1000:.1f} ms", "red")
+            # ECU contents are unknown now, so the next flash must be a full one
+            self.remove_sector_manifest(context["ecu_serial"], simulated, log)
+
+    def poll_flash_log(self):
+        """Move queued flashing messages into the Output Log"""
+        # Check liveness before draining so no message is left behind
+        running = self.flash_thread.is_alive()
+        while True:
+            try:
+                message, color, channel, timestamp = self.flash_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.log_entry(message, color, channel, timestamp)
+
+        if running:
+            self.after(50, self.poll_flash_log)
+        else:
+            self.btn_flash.configure(state="normal")
+
 if __name__ == "__main__":
     app = ValeoProfessionalGUI()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,503 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from Flashing_seq import (FlashScheduler, FlashSequenceError, LogStore, SectorManifest, SimulatedECU,
+                          action_check_digest, action_plan_delta, action_read_sector_hashes, compile_flash_sequence,
+                          hash_sectors, read_flash_sequence, read_sector_manifest, region_span, transfer_length,
+                          uds_request, write_sector_manifest)
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def make_store():
+    store = LogStore()
+    colors = ["red", "green", "blue"]
+    for i in range(10):
+        channel = "CANoe 1" if i % 2 else "CANoe 2"
+        store.add(f"m{i}", colors[i % 3], channel, T0 + timedelta(seconds=i))
+    return store
+
+
+def messages(records):
+    return [record.message for record in records]
+
+
+def test_query_without_filters_returns_all_in_order():
+    store = make_store()
+    assert messages(store.query()) == [f"m{i}" for i in range(10)]
+
+
+def test_query_by_level():
+    store = make_store()
+    assert messages(store.query(level="ERROR")) == ["m0", "m3", "m6", "m9"]
+    assert store.query(level="DEBUG") == []
+
+
+def test_query_by_level_and_channel():
+    store = make_store()
+    assert messages(store.query(level="ERROR", channel="CANoe 1")) == ["m3", "m9"]
+    assert store.query(channel="CANoe 3") == []
+
+
+def test_query_time_window():
+    store = make_store()
+    since = T0 + timedelta(seconds=5)
+    until = T0 + timedelta(seconds=7)
+    assert messages(store.query(since=since, until=until)) == ["m5", "m6", "m7"]
+    assert messages(store.query(since=since, channel="CANoe 2")) == ["m6", "m8"]
+    assert store.query(since=T0 + timedelta(seconds=20)) == []
+
+
+def test_out_of_order_record_keeps_its_time_and_index_stays_sorted():
+    store = LogStore()
+    store.add("later", timestamp=T0 + timedelta(seconds=5))
+    record = store.add("earlier", timestamp=T0)
+    assert record.timestamp == T0
+    assert store.timestamps == sorted(store.timestamps)
+    assert messages(store.query(since=T0 + timedelta(seconds=5))) == ["later", "earlier"]
+
+
+def test_unknown_color_maps_to_info_and_clear_drops_indexes():
+    store = LogStore()
+    store.add("x", "purple", "CANoe 1")
+    assert store.records[0].level == "INFO"
+    assert store.channels() == ["CANoe 1"]
+    store.clear()
+    assert len(store) == 0
+    assert store.query(level="INFO") == []
+    assert store.channels() == []
+
+
+# --- Flashing sequence compiler ---
+
+SEQUENCE_PATH = os.path.join(os.path.dirname(__file__), "flash_sequence.txt")
+
+
+def test_default_sequence_compiles_into_batches():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    batch_sizes = [len(batch) for batch in sequence.batches]
+    assert sum(batch_sizes) == len(sequence.steps)
+    assert [step.number for step in sequence.steps] == sorted(step.number for step in sequence.steps)
+    assert max(batch_sizes) > 1
+
+
+def test_steps_inherit_sequence_defaults():
+    sequence = compile_flash_sequence(
+        "Timeout = 2.5\nRetries = 3\nSectorSize = 0x10\n"
+        "Step1 = A\nService1 = 0x10 0x03\n"
+        "Step2 = B\nService2 = 0x3E 0x00\nTimeout2 = 0.5\nRetries2 = 0\n")
+    first, second = sequence.steps
+    assert (first.timeout, first.retries, first.service) == (2.5, 3, bytes([0x10, 0x03]))
+    assert (second.timeout, second.retries) == (0.5, 0)
+    assert sequence.sector_size == 0x10
+
+
+def test_consecutive_steps_with_same_group_share_a_batch():
+    sequence = compile_flash_sequence(
+        "Step1 = A\nService1 = 0x10\nGroup1 = 1\n"
+        "Step2 = B\nAction2 = compute_digest\nGroup2 = 1\n"
+        "Step3 = C\nService3 = 0x11\n"
+        "Step4 = D\nService4 = 0x3E\nGroup4 = 1\n")
+    assert [[step.name for step in batch] for batch in sequence.batches] == [["A", "B"], ["C"], ["D"]]
+    assert sequence.steps[1].on_ecu is False
+
+
+@pytest.mark.parametrize("content", [
+    "",
+    "Step1 = A\nAction1 = nope",
+    "Step1 = A",
+    "Step1 = A\nService1 = 0x10\nAction1 = compute_digest",
+    "Step1 = A\nServce1 = 0x10",
+    "Step1 = A\nService1 = 0xZZ",
+    "Step1 = A\nService1 = 0x100",
+    "this line has no equals sign",
+    "Retries = -1\nStep1 = A\nService1 = 0x10",
+    "Step1 = A\nService1 = 0x10\nRetries1 = -1",
+    "Timeout = 0\nStep1 = A\nService1 = 0x10",
+    "Step1 = A\nService1 = 0x10\nTimeout1 = -2",
+    "SectorSize = 0x0\nStep1 = A\nService1 = 0x10",
+    "Sector_Size = 0x800\nStep1 = A\nService1 = 0x10",
+    "BlockSize = 0x400\nStep1 = A\nService1 = 0x10",
+    "Timout = 5\nStep1 = A\nService1 = 0x10",
+    "Address = 0x1FFFFFFFF\nStep1 = A\nService1 = 0x10",
+    "Address = -0x1\nStep1 = A\nService1 = 0x10",
+])
+def test_invalid_sequences_are_rejected_at_compile_time(content):
+    with pytest.raises(FlashSequenceError):
+        compile_flash_sequence(content)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("hash_sectors", "plan_delta"),
+    ("plan_delta", "erase_memory"),
+    ("read_sector_hashes", "plan_delta"),
+    ("compute_digest", "compute_digest"),
+])
+def test_group_sharing_a_context_key_is_rejected(first, second):
+    content = (f"Step1 = A\nAction1 = {first}\nGroup1 = 1\n"
+               f"Step2 = B\nAction2 = {second}\nGroup2 = 1\n")
+    with pytest.raises(FlashSequenceError, match="cannot run in parallel"):
+        compile_flash_sequence(content)
+
+
+def test_dependent_steps_in_separate_batches_compile():
+    sequence = compile_flash_sequence(
+        "Step1 = A\nAction1 = hash_sectors\nGroup1 = 1\n"
+        "Step2 = B\nAction2 = compute_digest\nGroup2 = 1\n"
+        "Step3 = C\nAction3 = plan_delta\n")
+    assert len(sequence.batches) == 2
+
+
+def test_image_past_the_address_space_is_rejected_before_flashing():
+    sequence = compile_flash_sequence("Address = 0xFFFFFFF0\nStep1 = A\nService1 = 0x10")
+    with pytest.raises(FlashSequenceError, match="does not fit"):
+        FlashScheduler(sequence, SimulatedECU(latency=0)).run(bytes(32))
+
+
+class PendingECU:
+    """ECU that answers responsePending a number of times before the final response"""
+
+    def __init__(self, pending, delay=0.0):
+        self.pending = pending
+        self.delay = delay
+
+    def request(self, payload, timeout):
+        return bytes([0x7F, payload[0], 0x78])
+
+    def receive(self, timeout):
+        if self.delay > timeout:
+            raise TimeoutError("No response")
+        self.pending -= 1
+        return bytes([0x7F, 0x31, 0x78]) if self.pending > 0 else bytes([0x71, 0x01])
+
+
+def test_response_pending_waits_for_final_response():
+    response = uds_request(PendingECU(pending=3), bytes([0x31, 0x01, 0xFF, 0x00]), 1.0)
+    assert response == bytes([0x71, 0x01])
+
+
+def test_response_pending_past_the_timeout_times_out():
+    with pytest.raises(TimeoutError):
+        uds_request(PendingECU(pending=1, delay=5.0), bytes([0x31, 0x01, 0xFF, 0x00]), 0.01)
+
+
+def test_empty_image_is_rejected_before_flashing():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    ecu = ScriptedECU()
+    with pytest.raises(FlashSequenceError, match="empty"):
+        FlashScheduler(sequence, ecu).run(b"")
+    assert ecu.sent == []
+
+
+def test_security_access_without_key_algorithm_fails_the_step():
+    class NoKeyECU:
+        def request(self, payload, timeout):
+            return bytes([payload[0] + 0x40, 0x01, 0xAA])
+
+    sequence = compile_flash_sequence("Step1 = A\nAction1 = security_access")
+    results = FlashScheduler(sequence, NoKeyECU()).run(b"image")
+    assert not results[0].ok
+    assert "seed/key" in results[0].error
+
+
+def test_default_sequence_runs_on_simulated_ecu():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    ecu = SimulatedECU(latency=0, bytes_per_second=10 ** 12)
+    image = bytes(range(256)) * 20
+    results = FlashScheduler(sequence, ecu).run(image)
+    assert len(results) == len(sequence.steps)
+    assert all(result.ok for result in results)
+    assert bytes(ecu.memory) == image
+
+
+# --- Delta flashing ---
+
+def delta_context(image, sector_size=4, address=0x1000, manifest=None, ecu_serial=None):
+    return {
+        "image": bytes(image),
+        "address": address,
+        "sector_size": sector_size,
+        "sector_hashes": hash_sectors(bytes(image), sector_size),
+        "manifest": manifest,
+        "ecu_serial": ecu_serial,
+    }
+
+
+def manifest_for(image, sector_size=4, address=0x1000, ecu_serial=None):
+    return SectorManifest(address, sector_size, len(image), hash_sectors(bytes(image), sector_size), ecu_serial)
+
+
+def test_plan_delta_merges_adjacent_changed_sectors():
+    old = bytes(range(32))
+    new = bytearray(old)
+    new[5] ^= 1   # sector 1
+    new[9] ^= 1   # sector 2
+    new[20] ^= 1  # sector 5
+    context = delta_context(new, manifest=manifest_for(old))
+    action_plan_delta(context)
+    assert context["delta"] is True
+    assert context["regions"] == [(1, 3), (5, 6)]
+
+
+def test_plan_delta_handles_partial_last_sector():
+    old = bytes(range(10))  # sectors of 4, 4 and 2 bytes
+    new = bytearray(old)
+    new[-1] ^= 1
+    context = delta_context(new, manifest=manifest_for(old))
+    action_plan_delta(context)
+    assert context["regions"] == [(2, 3)]
+    address, size = region_span(context, 2, 3)
+    assert int.from_bytes(address, "big") == 0x1000 + 8
+    assert int.from_bytes(size, "big") == 2
+
+
+def test_plan_delta_unchanged_image_writes_nothing():
+    image = bytes(range(16))
+    context = delta_context(image, manifest=manifest_for(image))
+    action_plan_delta(context)
+    assert context["regions"] == []
+    assert context["delta"] is True
+
+
+@pytest.mark.parametrize("manifest", [
+    None,
+    manifest_for(bytes(range(16)), address=0x2000),
+    manifest_for(bytes(range(16)), sector_size=8),
+    manifest_for(bytes(range(12))),
+    SectorManifest(0x1000, 4, 16, hash_sectors(bytes(range(16)), 4)[:3]),
+    manifest_for(bytes(range(16)), ecu_serial="OTHER"),
+])
+def test_plan_delta_falls_back_to_full_flash(manifest):
+    image = bytearray(range(16))
+    image[0] ^= 1
+    context = delta_context(image, manifest=manifest)
+    action_plan_delta(context)
+    assert context["delta"] is False
+    assert context["regions"] == [(0, 4)]
+
+
+def test_plan_delta_with_every_sector_changed_is_a_full_flash():
+    old = bytes(16)
+    context = delta_context(bytes(range(1, 17)), manifest=manifest_for(old))
+    action_plan_delta(context)
+    assert context["delta"] is False
+    assert context["regions"] == [(0, 4)]
+
+
+def test_sector_manifest_round_trip_and_truncation(tmp_path):
+    path = str(tmp_path / "manifests" / "CANoe_1.txt")
+    manifest = manifest_for(bytes(range(10)), ecu_serial="ABC123")
+    write_sector_manifest(path, manifest)
+
+    loaded = read_sector_manifest(path)
+    assert (loaded.address, loaded.sector_size, loaded.image_size) == (0x1000, 4, 10)
+    assert loaded.ecu_serial == "ABC123"
+    assert loaded.hashes == manifest.hashes
+
+    with open(path, encoding="utf-8") as file:
+        lines = [line for line in file if not line.startswith("Sector3")]
+    with open(path, "w", encoding="utf-8") as file:
+        file.writelines(lines)
+    assert read_sector_manifest(path) is None
+    assert read_sector_manifest(str(tmp_path / "missing.txt")) is None
+
+
+class ScriptedECU(SimulatedECU):
+    """SimulatedECU that can time out or reject chosen requests"""
+
+    def __init__(self, timeouts=(), silent=(), negative=()):
+        super().__init__(latency=0, bytes_per_second=10 ** 12)
+        self.timeouts = list(timeouts)  # Payloads to time out on, once each
+        self.silent = silent            # Request prefixes that always time out
+        self.negative = negative        # Request prefixes answered with a negative response
+        self.sent = []
+
+    def request(self, payload, timeout):
+        self.sent.append(payload)
+        if payload in self.timeouts:
+            self.timeouts.remove(payload)
+            raise TimeoutError("No response")
+        if any(payload.startswith(prefix) for prefix in self.silent):
+            raise TimeoutError("No response")
+        if any(payload.startswith(prefix) for prefix in self.negative):
+            return bytes([0x7F, payload[0], 0x31])
+        return super().request(payload, timeout)
+
+
+READ_HASHES = bytes([0x31, 0x01, 0x02, 0x03])
+
+
+@pytest.mark.parametrize("ecu", [
+    ScriptedECU(negative=[READ_HASHES]),
+    ScriptedECU(silent=[READ_HASHES]),
+])
+def test_read_sector_hashes_keeps_stored_manifest_when_ecu_cannot_answer(ecu):
+    image = bytes(range(16))
+    stored = manifest_for(image)
+    context = delta_context(image, manifest=stored)
+    action_read_sector_hashes(context, lambda payload: uds_request(ecu, payload, 1.0))
+    assert context["manifest"] is stored
+
+
+def test_read_sector_hashes_from_erased_ecu_clears_manifest():
+    image = bytes(range(16))
+    ecu = ScriptedECU()
+    context = delta_context(image, manifest=manifest_for(image))
+    action_read_sector_hashes(context, lambda payload: uds_request(ecu, payload, 1.0))
+    assert context["manifest"] is None
+
+
+def test_second_flash_only_writes_changed_sectors():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    ecu = ScriptedECU()
+    image = bytearray(os.urandom(sequence.sector_size * 8 + 100))
+    scheduler = FlashScheduler(sequence, ecu)
+
+    assert all(result.ok for result in scheduler.run(bytes(image)))
+    assert scheduler.context["delta"] is False
+
+    image[sequence.sector_size * 3 + 7] ^= 0xFF
+    ecu.sent.clear()
+    assert all(result.ok for result in scheduler.run(bytes(image)))
+    assert scheduler.context["regions"] == [(3, 4)]
+    transfers = [payload for payload in ecu.sent if payload[0] == 0x36]
+    assert sum(len(payload) - 2 for payload in transfers) == sequence.sector_size
+    assert bytes(ecu.memory) == bytes(image)
+
+
+def flash_and_store(sequence, ecu, image, manifests):
+    """Flash image and keep its manifest by ECU serial, as the GUI does"""
+    scheduler = FlashScheduler(sequence, ecu)
+    results = scheduler.run(bytes(image), manifests.get)
+    assert all(result.ok for result in results)
+    manifests[scheduler.context["ecu_serial"]] = scheduler.written_manifest()
+    return scheduler
+
+
+def test_flash_falls_back_to_stored_manifest_when_read_back_times_out():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    image = bytearray(os.urandom(sequence.sector_size * 4))
+    ecu = ScriptedECU()
+    manifests = {}
+    flash_and_store(sequence, ecu, image, manifests)
+
+    image[0] ^= 0xFF
+    ecu.silent = [READ_HASHES]
+    scheduler = flash_and_store(sequence, ecu, image, manifests)
+    assert scheduler.context["regions"] == [(0, 1)]
+    assert bytes(ecu.memory) == bytes(image)
+
+
+def test_swapped_ecu_on_same_channel_gets_a_full_flash():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    image = bytearray(os.urandom(sequence.sector_size * 4))
+    ecu_a = ScriptedECU()
+    manifests = {}
+    flash_and_store(sequence, ecu_a, image, manifests)
+    manifest_a = manifests[ecu_a.serial.hex().upper()]
+
+    # ECU B has other firmware and cannot report its hashes
+    ecu_b = ScriptedECU(silent=[READ_HASHES])
+    ecu_b.memory = bytearray(os.urandom(len(image)))
+    image[0] ^= 0xFF
+
+    # Even a lookup that ignores the serial (like a per-channel file) must not be trusted
+    scheduler = FlashScheduler(sequence, ecu_b)
+    results = scheduler.run(bytes(image), lambda ecu_serial: manifest_a)
+    assert all(result.ok for result in results)
+    assert scheduler.context["delta"] is False
+    assert bytes(ecu_b.memory) == bytes(image)
+
+
+def test_ecu_without_serial_number_gets_a_full_flash():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    image = bytearray(os.urandom(sequence.sector_size * 4))
+    ecu = ScriptedECU()
+    manifests = {}
+    flash_and_store(sequence, ecu, image, manifests)
+
+    image[0] ^= 0xFF
+    ecu.silent = [READ_HASHES]
+    ecu.negative = [bytes([0x22])]
+    scheduler = FlashScheduler(sequence, ecu)
+    assert all(result.ok for result in scheduler.run(bytes(image), lambda ecu_serial: manifests[ecu_serial]))
+    assert scheduler.context["ecu_serial"] is None
+    assert scheduler.context["delta"] is False
+    assert bytes(ecu.memory) == bytes(image)
+
+
+def test_check_digest_fails_when_ecu_memory_differs():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    image = os.urandom(sequence.sector_size * 2)
+    ecu = ScriptedECU()
+    flash_and_store(sequence, ecu, image, {})
+
+    ecu.memory[5] ^= 0xFF
+    context = {"image": image, "address": sequence.address, "digest": hashlib.sha256(image).digest()}
+    with pytest.raises(FlashSequenceError, match="NRC 0x72"):
+        action_check_digest(context, lambda payload: uds_request(ecu, payload, 1.0))
+
+
+def test_transfer_data_timeout_resends_same_chunk_without_new_download():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    image = os.urandom(sequence.sector_size * 4)
+    ecu = ScriptedECU()
+    length = ecu.max_block_length - 2
+    third_chunk = bytes([0x36, 3]) + image[length * 2:length * 3]
+    ecu.timeouts = [third_chunk]
+
+    results = FlashScheduler(sequence, ecu).run(image)
+    assert all(result.ok for result in results)
+    assert ecu.sent.count(third_chunk) == 2
+    download = next(result for result in results if result.step.name == "DownloadRegions")
+    assert download.retries == 1
+    assert download.requests == sum(1 for payload in ecu.sent if payload[0] in (0x34, 0x36, 0x37))
+    assert sum(1 for payload in ecu.sent if payload[0] == 0x34) == 1
+    assert bytes(ecu.memory) == image
+
+
+def test_transfer_data_is_chunked_to_the_ecu_max_block_length():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    image = os.urandom(sequence.sector_size * 10 + 100)
+    ecu = ScriptedECU()
+    ecu.max_block_length = 0x82
+
+    assert all(result.ok for result in FlashScheduler(sequence, ecu).run(image))
+    transfers = [payload for payload in ecu.sent if payload[0] == 0x36]
+    assert max(len(payload) for payload in transfers) == 0x82
+    # More than 255 chunks: the block sequence counter wraps around
+    assert [payload[1] for payload in transfers] == [i & 0xFF for i in range(1, len(transfers) + 1)]
+    assert bytes(ecu.memory) == image
+
+
+def test_delta_erases_whole_sectors():
+    sequence = read_flash_sequence(SEQUENCE_PATH)
+    image = bytearray(os.urandom(sequence.sector_size * 4))
+    ecu = ScriptedECU()
+    flash_and_store(sequence, ecu, image, {})
+
+    image[sequence.sector_size * 2 + 5] ^= 0xFF
+    ecu.sent.clear()
+    assert all(result.ok for result in FlashScheduler(sequence, ecu).run(bytes(image)))
+    erases = [payload for payload in ecu.sent if payload[:4] == bytes([0x31, 0x01, 0xFF, 0x00])]
+    assert [(int.from_bytes(payload[5:9], "big"), int.from_bytes(payload[9:13], "big")) for payload in erases] == \
+        [(sequence.address + sequence.sector_size * 2, sequence.sector_size)]
+    assert bytes(ecu.memory) == bytes(image)
+
+
+@pytest.mark.parametrize("response", [
+    bytes([0x74]),
+    bytes([0x74, 0x00]),
+    bytes([0x74, 0x20, 0x04]),
+    bytes([0x74, 0x20, 0x00, 0x02]),
+])
+def test_unusable_request_download_response_is_rejected(response):
+    with pytest.raises(FlashSequenceError):
+        transfer_length(response)
+
+
+def test_request_download_response_gives_transfer_length():
+    assert transfer_length(bytes([0x74, 0x20, 0x04, 0x02])) == 0x400